@@ -1,25 +1,39 @@
-import copy
 import json
 import logging
 import os
 import random
 import re
+import shutil
+import signal
 import subprocess
+import tempfile
 import threading
 import time
 import uuid
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
-from google.auth.exceptions import RefreshError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from google.auth.exceptions import GoogleAuthError, RefreshError, TransportError
 from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 
 logger = logging.getLogger(__name__)
 
+_SANITIZE_RE = re.compile(r"[^A-Za-z0-9._-]")
+_MIME_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/heic": ".heic",
+    "image/heif": ".heic",
+}
+
 
 class PhotosPickerServiceError(Exception):
     """Base exception raised for Photos Picker service failures."""
@@ -40,7 +54,7 @@ class PhotosPickerApiError(PhotosPickerServiceError):
         self.details = details
 
 
-@dataclass
+@dataclass(frozen=True)
 class _SessionState:
     session: Dict[str, Any]
     state: str
@@ -62,9 +76,40 @@ class PhotosPickerService:
     BASE_URL = "https://photospicker.googleapis.com/v1"
     SCOPES = ["https://www.googleapis.com/auth/photospicker.mediaitems.readonly"]
     DEFAULT_POLL_INTERVAL_SECONDS = 5.0
+    MAX_POLL_RETRIES = 5
+    POLL_BACKOFF_BASE = 1.3
+    POLL_BACKOFF_MAX_SECONDS = 60.0
+    POLL_BACKOFF_JITTER_SECONDS = 0.5
     MAX_POLL_DURATION = timedelta(minutes=15)
+    MAX_TRACKED_SESSIONS = 64
+    FINISHED_SESSION_RETENTION = timedelta(hours=1)
+    TERMINAL_STATES = frozenset(["COMPLETE", "ERROR", "TIMEOUT"])
     DEFAULT_TOKEN_FILE = "picker_token.json"
     DEFAULT_OAUTH_PORT = 8090
+    SLIDESHOW_INTERVAL_SECONDS = 120
+    SLIDESHOW_RETRY_SECONDS = 5
+    FEH_PID_FILE = "feh.pid"
+    PHOTO_CACHE_SETTLE_SECONDS = 2
+    FEH_ARGS = (
+        'feh',
+        '--fullscreen',
+        '--borderless',
+        '--quiet',
+        '--zoom', 'fill',
+        '--randomize',
+    )
+    CREDENTIALS_EXPIRY_MARGIN_SECONDS = 60.0
+    MAX_DOWNLOAD_WORKERS = 8
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    DOWNLOAD_WRITE_BUFFER_SIZE = 256 * 1024
+    # One pool each for the Picker API and the media host, sized well above the
+    # download concurrency so bursts never discard keep-alive connections.
+    HTTP_POOL_CONNECTIONS = 2
+    HTTP_POOL_MAXSIZE = 32
+    HTTP_RETRY_TOTAL = 5
+    HTTP_RETRY_BACKOFF_FACTOR = 0.5
+    HTTP_RETRY_STATUS_FORCELIST = (429, 500, 502, 503, 504)
+    HTTP_RETRY_ALLOWED_METHODS = frozenset(["GET", "HEAD", "DELETE"])
 
     def __init__(self, storage_dir: str = "screensaver", credentials_file: str = "credentials.json",
                  token_file: Optional[str] = None) -> None:
@@ -76,17 +121,48 @@ class PhotosPickerService:
         os.makedirs(self._storage_dir, exist_ok=True)
         self._photos_dir = os.path.join(self._storage_dir, "photos")
         os.makedirs(self._photos_dir, exist_ok=True)
+        # Precomputed prefixes let the download and listing paths build absolute and
+        # storage-relative photo paths by concatenation instead of join/relpath.
+        self._photos_dir_prefix = os.path.join(self._photos_dir, "")
+        self._photos_rel_prefix = os.path.join(os.path.relpath(self._photos_dir, self._storage_dir), "")
+        self._feh_cmd = (
+            *self.FEH_ARGS,
+            '--slideshow-delay', str(self.SLIDESHOW_INTERVAL_SECONDS),
+            self._photos_dir,
+        )
 
         self._cred_lock = threading.Lock()
         self._state_lock = threading.Lock()
         self._slideshow_lock = threading.Lock()
         self._slideshow_trigger = threading.Event()
         self._slideshow_stop = threading.Event()
+        # Set by stop() and never cleared, so a stopped service stays stopped.
+        self._stopped = False
 
         self._creds: Optional[Credentials] = None
+        self._creds_expiry_monotonic = 0.0
+        self._stored_token: Optional[Tuple[Any, ...]] = None
+        self._http: Optional[AuthorizedSession] = None
+        self._download_http: Optional[requests.Session] = None
         self._states: Dict[str, _SessionState] = {}
         self._threads: Dict[str, threading.Thread] = {}
         self._slideshow_thread: Optional[threading.Thread] = None
+        self._photo_cache: Optional[Tuple[int, List[str]]] = None
+        self._feh_proc: Optional[subprocess.Popen] = None
+        self._feh_photos: Optional[List[str]] = None
+        self._feh_pid_path = os.path.join(self._storage_dir, self.FEH_PID_FILE)
+
+        # mkstemp creates files as 0600; downloads are chmod-ed to the mode a plain
+        # open() would have produced. Reading the umask means briefly setting it.
+        umask = os.umask(0)
+        os.umask(umask)
+        self._download_file_mode = 0o666 & ~umask
+
+        # feh runs in its own session, so one left behind by a killed or crashed
+        # process would otherwise stay fullscreen underneath the new slideshow.
+        self._kill_stale_feh()
+        # Likewise drop .part files orphaned by downloads interrupted in a previous run.
+        self._remove_partial_downloads()
 
         # Start slideshow with existing photos if any are available
         self._start_slideshow()
@@ -100,19 +176,47 @@ class PhotosPickerService:
         try:
             with open(self._token_path, "r", encoding="utf-8") as token_file:
                 data = json.load(token_file)
-            return Credentials.from_authorized_user_info(data, self.SCOPES)
+            creds = Credentials.from_authorized_user_info(data, self.SCOPES)
         except (ValueError, TypeError) as exc:
             logger.warning("Failed to load stored Google Photos Picker credentials: %s", exc)
             return None
+        self._stored_token = self._token_snapshot(creds)
+        return creds
+
+    @staticmethod
+    def _token_snapshot(creds: Credentials) -> Tuple[Any, ...]:
+        return (creds.token, creds.refresh_token, creds.expiry)
 
     def _store_credentials(self, creds: Credentials) -> None:
-        with open(self._token_path, "w", encoding="utf-8") as token_file:
+        snapshot = self._token_snapshot(creds)
+        if snapshot == self._stored_token:
+            return
+        # Write to a temporary file and swap it in so a crash never leaves a truncated token file.
+        tmp_path = f"{self._token_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as token_file:
             token_file.write(creds.to_json())
+        os.replace(tmp_path, self._token_path)
+        self._stored_token = snapshot
+
+    def _credentials_deadline(self, creds: Credentials) -> float:
+        """Translate the credential expiry into a ``time.monotonic()`` deadline."""
+        if creds.expiry is None:
+            return 0.0
+        # google-auth stores expiry as a naive UTC datetime.
+        remaining = creds.expiry.replace(tzinfo=timezone.utc) - self._now()
+        return time.monotonic() + remaining.total_seconds()
 
     def _ensure_credentials(self) -> Credentials:
+        # Fast path: skip the lock while the cached token is comfortably valid.
+        creds = self._creds
+        deadline = self._creds_expiry_monotonic - self.CREDENTIALS_EXPIRY_MARGIN_SECONDS
+        if creds is not None and time.monotonic() < deadline:
+            return creds
+
         with self._cred_lock:
             creds = self._creds
             if creds and creds.valid:
+                self._creds_expiry_monotonic = self._credentials_deadline(creds)
                 return creds
 
             if not creds:
@@ -131,16 +235,109 @@ class PhotosPickerService:
                         f"OAuth client secrets not found at {self._credentials_path}. "
                         "Ensure the Google Photos Picker credentials are available."
                     )
+                # Only needed for the interactive first-run flow, so keep it off the import path.
+                from google_auth_oauthlib.flow import InstalledAppFlow
+
                 flow = InstalledAppFlow.from_client_secrets_file(self._credentials_path, self.SCOPES)
                 creds = flow.run_local_server(port=self.DEFAULT_OAUTH_PORT, open_browser=False)
 
             self._store_credentials(creds)
             self._creds = creds
+            self._creds_expiry_monotonic = self._credentials_deadline(creds)
             return creds
 
+    def _mount_pooled_adapter(self, http: requests.Session) -> None:
+        adapter = HTTPAdapter(
+            pool_connections=self.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=self.HTTP_POOL_MAXSIZE,
+            max_retries=Retry(
+                total=self.HTTP_RETRY_TOTAL,
+                backoff_factor=self.HTTP_RETRY_BACKOFF_FACTOR,
+                status_forcelist=self.HTTP_RETRY_STATUS_FORCELIST,
+                allowed_methods=self.HTTP_RETRY_ALLOWED_METHODS,
+                raise_on_status=False,
+            ),
+        )
+        http.mount("http://", adapter)
+        http.mount("https://", adapter)
+
     def _authorized_session(self) -> AuthorizedSession:
+        """Return the shared authorized HTTP session, creating it on first use.
+
+        A single session is reused for every API call so the underlying
+        keep-alive connections (and their TLS handshakes) are pooled.
+        """
         creds = self._ensure_credentials()
-        return AuthorizedSession(creds)
+        http = self._http
+        if http is not None and http.credentials is creds:
+            return http
+
+        with self._cred_lock:
+            if self._http is None:
+                http = AuthorizedSession(creds)
+                self._mount_pooled_adapter(http)
+                self._http = http
+            elif self._http.credentials is not creds:
+                self._http.credentials = creds
+            return self._http
+
+    def _download_session(self) -> requests.Session:
+        """Return the pooled session used for media downloads.
+
+        Downloads send a bearer header built from the cached token instead of
+        going through AuthorizedSession, whose per-request credential check
+        would contend on the credentials lock across download workers.
+        """
+        http = self._download_http
+        if http is not None:
+            return http
+
+        with self._cred_lock:
+            if self._download_http is None:
+                http = requests.Session()
+                self._mount_pooled_adapter(http)
+                self._download_http = http
+            return self._download_http
+
+    def _media_auth_headers(self) -> Dict[str, str]:
+        creds = self._ensure_credentials()
+        return {"Authorization": f"Bearer {creds.token}"}
+
+    def _refresh_media_headers(self, stale_headers: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """Return headers with a fresh token after a 401, or None if none can be had.
+
+        Only a plain token refresh is attempted; the interactive consent flow is
+        never started from a download worker. Workers that hit a 401 together
+        share the first refresh.
+        """
+        with self._cred_lock:
+            creds = self._creds
+            if creds is None:
+                return None
+            if f"Bearer {creds.token}" == stale_headers.get("Authorization"):
+                if not creds.refresh_token:
+                    return None
+                try:
+                    creds.refresh(Request())
+                except GoogleAuthError as exc:
+                    logger.warning("Failed to refresh Google Photos Picker credentials: %s", exc)
+                    return None
+                self._creds_expiry_monotonic = self._credentials_deadline(creds)
+                try:
+                    self._store_credentials(creds)
+                except OSError as exc:
+                    logger.warning("Failed to store refreshed Google Photos Picker credentials: %s", exc)
+            return {"Authorization": f"Bearer {creds.token}"}
+
+    def _media_request(self, session: requests.Session, method: str, url: str,
+                       headers: Dict[str, str], **kwargs: Any) -> requests.Response:
+        response = session.request(method, url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            refreshed = self._refresh_media_headers(headers)
+            if refreshed is not None:
+                response.close()
+                response = session.request(method, url, headers=refreshed, **kwargs)
+        return response
 
     # ------------------------------------------------------------------
     # Helper utilities
@@ -167,7 +364,7 @@ class PhotosPickerService:
         state_value = "COMPLETE" if session_data.get("mediaItemsSet") else "PENDING"
         completed_at = now if state_value == "COMPLETE" else None
         with self._state_lock:
-            self._states[session_data["id"]] = _SessionState(
+            new_state = _SessionState(
                 session=session_data,
                 state=state_value,
                 created_at=now,
@@ -181,62 +378,88 @@ class PhotosPickerService:
                 request_id=request_id,
                 downloaded_files=[],
             )
+            states = {**self._states, session_data["id"]: new_state}
+            self._states = self._evict_finished_sessions(states, now)
+
+    def _evict_finished_sessions(self, states: Dict[str, _SessionState],
+                                 now: datetime) -> Dict[str, _SessionState]:
+        """Drop the oldest finished sessions once more than MAX_TRACKED_SESSIONS are cached."""
+        excess = len(states) - self.MAX_TRACKED_SESSIONS
+        if excess <= 0:
+            return states
+
+        cutoff = now - self.FINISHED_SESSION_RETENTION
+        # Dicts keep insertion order, so the first matches are the oldest sessions.
+        expired = []
+        for session_id, state in states.items():
+            if state.state in self.TERMINAL_STATES and state.updated_at < cutoff:
+                expired.append(session_id)
+                if len(expired) >= excess:
+                    break
+        for session_id in expired:
+            del states[session_id]
+        return states
 
     def _set_state(self, session_id: str, *, session: Optional[Dict[str, Any]] = None,
                    state: Optional[str] = None, media_items: Optional[List[Dict[str, Any]]] = None,
                    error: Optional[Dict[str, Any]] = None, last_polled_at: Optional[datetime] = None,
                    completed_at: Optional[datetime] = None,
                    downloaded_files: Optional[List[str]] = None) -> None:
-        now = self._now()
+        changes: Dict[str, Any] = {"updated_at": self._now()}
+        if session is not None:
+            changes["session"] = session
+        if state is not None:
+            changes["state"] = state
+        if media_items is not None:
+            changes["media_items"] = media_items
+        if error is not None:
+            changes["error"] = error
+        if last_polled_at is not None:
+            changes["last_polled_at"] = last_polled_at
+        if completed_at is not None:
+            changes["completed_at"] = completed_at
+        if downloaded_files is not None:
+            changes["downloaded_files"] = downloaded_files
+
         with self._state_lock:
             state_entry = self._states.get(session_id)
             if not state_entry:
                 return
-            if session is not None:
-                state_entry.session = session
-            if state is not None:
-                state_entry.state = state
-            if media_items is not None:
-                state_entry.media_items = media_items
-            if error is not None:
-                state_entry.error = error
-            if last_polled_at is not None:
-                state_entry.last_polled_at = last_polled_at
-            if completed_at is not None:
-                state_entry.completed_at = completed_at
-            if downloaded_files is not None:
-                state_entry.downloaded_files = downloaded_files
-            state_entry.updated_at = now
+            # Publish a new mapping so lock-free readers never observe a partial update.
+            self._states = {**self._states, session_id: replace(state_entry, **changes)}
 
     def _serialize_state(self, session_id: str, state: _SessionState) -> Dict[str, Any]:
+        # Cached API payloads are only ever replaced wholesale by _set_state and
+        # never mutated in place, so they can be shared without copying.
         def _iso(dt: Optional[datetime]) -> Optional[str]:
             return dt.isoformat() if dt else None
 
         return {
             "sessionId": session_id,
             "state": state.state,
-            "session": copy.deepcopy(state.session),
+            "session": state.session,
             "createdAt": _iso(state.created_at),
             "updatedAt": _iso(state.updated_at),
             "lastPolledAt": _iso(state.last_polled_at),
             "completedAt": _iso(state.completed_at),
             "pollingDeadline": _iso(state.deadline),
             "pollIntervalSeconds": state.poll_interval_seconds,
-            "mediaItems": copy.deepcopy(state.media_items),
+            "mediaItems": state.media_items,
             "mediaItemsCount": len(state.media_items),
-            "error": copy.deepcopy(state.error),
+            "error": state.error,
             "requestId": state.request_id,
             "downloadedFiles": list(state.downloaded_files),
             "downloadedFilesCount": len(state.downloaded_files),
         }
 
     def _request(self, method: str, path: str, **kwargs: Any) -> Dict[str, Any]:
-        session = self._authorized_session()
         url = f"{self.BASE_URL}{path}"
         kwargs.setdefault("timeout", 30)
         try:
+            session = self._authorized_session()
             response = session.request(method, url, **kwargs)
-        except requests.exceptions.RequestException as exc:
+        except (requests.exceptions.RequestException, TransportError) as exc:
+            # TransportError covers network failures while refreshing the OAuth token.
             raise PhotosPickerServiceError(
                 f"Failed to call Google Photos Picker API: {exc}" ) from exc
 
@@ -288,146 +511,290 @@ class PhotosPickerService:
     # ------------------------------------------------------------------
     @staticmethod
     def _sanitize_filename(name: str) -> str:
-        sanitized = re.sub(r"[^A-Za-z0-9._-]", "_", name)
-        return sanitized or "photo"
+        return _SANITIZE_RE.sub("_", name) or "photo"
 
     @staticmethod
     def _extension_from_mime(mime_type: Optional[str]) -> str:
         if not mime_type:
             return ""
-        if mime_type == "image/jpeg":
-            return ".jpg"
-        if mime_type == "image/png":
-            return ".png"
-        if mime_type == "image/gif":
-            return ".gif"
-        if mime_type in {"image/webp", "image/heic", "image/heif"}:
-            return ".webp" if mime_type == "image/webp" else ".heic"
+        extension = _MIME_EXTENSIONS.get(mime_type)
+        if extension is not None:
+            return extension
         if mime_type.startswith("video/"):
             return ".mp4"
         return ""
 
+    def _remove_partial_downloads(self) -> None:
+        try:
+            with os.scandir(self._photos_dir) as it:
+                stale = [entry.path for entry in it if entry.name.endswith(".part")]
+        except FileNotFoundError:
+            return
+        for part_path in stale:
+            self._discard_partial(part_path)
+
+    @staticmethod
+    def _discard_partial(part_path: Optional[str]) -> None:
+        if part_path is None:
+            return
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+    def _is_download_current(self, session: requests.Session, headers: Dict[str, str], download_url: str,
+                             existing: os.DirEntry) -> bool:
+        """Check with a HEAD request whether an existing file matches the remote size.
+
+        The local copy is kept whenever the size cannot be compared.
+        """
+        try:
+            local_size = existing.stat(follow_symlinks=False).st_size
+            response = self._media_request(session, "HEAD", download_url, headers, timeout=10,
+                                           allow_redirects=True)
+            response.raise_for_status()
+        except (OSError, requests.exceptions.RequestException) as exc:
+            logger.debug("Unable to verify existing download %s: %s", existing.path, exc)
+            return True
+
+        remote_size = response.headers.get("Content-Length")
+        if not remote_size or not remote_size.isdigit():
+            return True
+        return int(remote_size) == local_size
+
+    def _target_filename(self, session_id: str, index: int, item: Dict[str, Any]) -> str:
+        mediaFile = item.get("mediaFile") or {}
+        filename = mediaFile.get("filename") or f"{session_id}_{index}"
+        filename = self._sanitize_filename(filename)
+        if not os.path.splitext(filename)[1]:
+            filename += self._extension_from_mime(mediaFile.get("mimeType"))
+        return filename
+
+    def _download_one(self, session: requests.Session, headers: Dict[str, str],
+                      existing_files: Dict[str, os.DirEntry], item: Dict[str, Any],
+                      filename: str) -> Optional[str]:
+        mediaFile = item.get("mediaFile") or {}
+        base_url = mediaFile.get("baseUrl")
+        if not base_url:
+            logger.warning("Skipping media item %s with no baseUrl", item.get("id", "<unknown>"))
+            return None
+
+        file_path = self._photos_dir_prefix + filename
+
+        download_url = f"{base_url}=d"
+        existing = existing_files.get(filename)
+        if existing is not None and self._is_download_current(session, headers, download_url, existing):
+            logger.debug("Media item %s already downloaded as %s", item.get("id", "<unknown>"), filename)
+            return self._photos_rel_prefix + filename
+
+        # Stream into a uniquely named temporary file and rename on success so an
+        # interrupted download never leaves a truncated file that looks complete,
+        # and concurrent completions never share a temporary file.
+        part_path = None
+        try:
+            with self._media_request(session, "GET", download_url, headers, timeout=120,
+                                     stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                fd, part_path = tempfile.mkstemp(dir=self._photos_dir, prefix=f".{filename}.", suffix=".part")
+                os.fchmod(fd, self._download_file_mode)
+                with os.fdopen(fd, "wb", buffering=self.DOWNLOAD_WRITE_BUFFER_SIZE) as file_handle:
+                    shutil.copyfileobj(response.raw, file_handle, length=self.DOWNLOAD_CHUNK_SIZE)
+            os.replace(part_path, file_path)
+        except requests.exceptions.RequestException as exc:
+            logger.warning("Failed to download media item %s: %s", item.get("id", "<unknown>"), exc)
+            self._discard_partial(part_path)
+            return None
+        except OSError as exc:
+            logger.warning("Failed to store media item %s: %s", item.get("id", "<unknown>"), exc)
+            self._discard_partial(part_path)
+            return None
+
+        return self._photos_rel_prefix + filename
+
     def _download_media_items(self, session_id: str, media_items: List[Dict[str, Any]]) -> List[str]:
-        print (f"Downloading {len(media_items)} media items for session {session_id}")
+        logger.info("Downloading %d media items for session %s", len(media_items), session_id)
         if not media_items:
             return []
 
-        session = self._authorized_session()
-        downloaded_files: List[str] = []
+        session = self._download_session()
+        # Resolve the bearer token once per batch; workers only go back to the
+        # credentials after a 401, through _refresh_media_headers.
+        headers = self._media_auth_headers()
+        # One directory pass answers "already downloaded?" for the whole batch
+        # instead of a stat per item.
+        try:
+            with os.scandir(self._photos_dir) as it:
+                existing_files = {entry.name: entry for entry in it if entry.is_file(follow_symlinks=False)}
+        except FileNotFoundError:
+            existing_files = {}
+
+        # Items that map to the same file (cameras reuse names such as IMG_0001.JPG)
+        # are downloaded once; as in a serial loop, the first item wins.
+        unique: Dict[str, Dict[str, Any]] = {}
+        targets: List[str] = []
         for index, item in enumerate(media_items, start=1):
-            mediaFile = item.get("mediaFile")
-            base_url = mediaFile.get("baseUrl")
-            if not base_url:
-                print (f"Skipping media item {item.get('id', '<unknown>')} with no baseUrl")
-                continue
-
-            filename = mediaFile.get("filename") or f"{session_id}_{index}"
-            filename = self._sanitize_filename(filename)
-            if not os.path.splitext(filename)[1]:
-                filename += self._extension_from_mime(mediaFile.get("mimeType"))
-            file_path = os.path.join(self._photos_dir, filename)
-
-            if os.path.exists(file_path):
-                downloaded_files.append(os.path.relpath(file_path, self._storage_dir))
-                print (f"Media item {item.get('id', '<unknown>')} already downloaded as {filename}")
-                continue
-
-            download_url = f"{base_url}=d"
-            try:
-                response = session.get(download_url, timeout=120)
-                response.raise_for_status()
-            except requests.exceptions.RequestException as exc:
-                logger.warning("Failed to download media item %s: %s", item.get("id", "<unknown>"), exc)
-                continue
+            filename = self._target_filename(session_id, index, item)
+            unique.setdefault(filename, item)
+            targets.append(filename)
+
+        workers = min(self.MAX_DOWNLOAD_WORKERS, len(unique))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photos-picker-download") as executor:
+            futures = {
+                filename: executor.submit(self._download_one, session, headers, existing_files, item, filename)
+                for filename, item in unique.items()
+            }
+            # Report results in item order, keeping the file list deterministic.
+            return [path for path in (futures[filename].result() for filename in targets) if path]
 
-            try:
-                with open(file_path, "wb") as file_handle:
-                    file_handle.write(response.content)
-            except OSError as exc:
-                logger.warning("Failed to store media item %s: %s", item.get("id", "<unknown>"), exc)
-                continue
+    def _list_downloaded_files(self) -> List[str]:
+        """Return the sorted photo paths relative to the storage directory.
 
-            downloaded_files.append(os.path.relpath(file_path, self._storage_dir))
+        The listing is cached against the directory's mtime, which changes
+        whenever a file is created, renamed or removed. Because that mtime has
+        coarse granularity (down to 2s on vfat), a listing taken while the
+        directory was modified very recently is not cached.
+        """
+        try:
+            mtime_ns = os.stat(self._photos_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
 
-        return downloaded_files
+        cached = self._photo_cache
+        if cached is not None and cached[0] == mtime_ns:
+            return list(cached[1])
 
-    def _list_downloaded_files(self) -> List[str]:
+        rel_prefix = self._photos_rel_prefix
         try:
-            entries = [
-                os.path.relpath(os.path.join(self._photos_dir, entry), self._storage_dir)
-                for entry in os.listdir(self._photos_dir)
-                if os.path.isfile(os.path.join(self._photos_dir, entry))
-            ]
+            with os.scandir(self._photos_dir) as it:
+                entries = [
+                    rel_prefix + entry.name
+                    for entry in it
+                    if not entry.name.endswith(".part") and entry.is_file(follow_symlinks=False)
+                ]
         except FileNotFoundError:
             return []
 
         entries.sort()
-        return entries
+        # A later change within the same mtime tick would leave the stamp unchanged
+        # and the cached listing stale, so only cache once the directory has settled.
+        settled = time.time_ns() - mtime_ns >= self.PHOTO_CACHE_SETTLE_SECONDS * 1_000_000_000
+        self._photo_cache = (mtime_ns, entries) if settled else None
+        return list(entries)
+
+    def _feh_running(self) -> bool:
+        return self._feh_proc is not None and self._feh_proc.poll() is None
 
-    def _choose_random_photo(self) -> Optional[str]:
+    def _kill_stale_feh(self) -> None:
+        """Terminate a feh recorded in the pidfile by a previous run, if still alive."""
         try:
-            entries = [
-                os.path.join(self._photos_dir, entry)
-                for entry in os.listdir(self._photos_dir)
-                if os.path.isfile(os.path.join(self._photos_dir, entry))
-            ]
-        except FileNotFoundError:
-            return None
+            with open(self._feh_pid_path, "r", encoding="utf-8") as pid_file:
+                pid = int(pid_file.read().strip())
+        except (OSError, ValueError):
+            return
 
-        if not entries:
-            return None
+        # Guard against pid reuse: only signal the process if it is still feh.
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as cmdline_file:
+                program = cmdline_file.read().split(b"\0", 1)[0]
+        except OSError:
+            program = b""
+        if os.path.basename(program) == b"feh":
+            try:
+                os.kill(pid, signal.SIGTERM)
+                logger.info("Terminated stale feh slideshow (pid %d)", pid)
+            except OSError as exc:
+                logger.debug("Failed to terminate stale feh %d: %s", pid, exc)
+        self._remove_feh_pidfile()
 
-        return random.choice(entries)
+    def _remove_feh_pidfile(self) -> None:
+        try:
+            os.remove(self._feh_pid_path)
+        except OSError:
+            pass
+
+    def _stop_feh(self) -> None:
+        proc = self._feh_proc
+        self._feh_proc = None
+        if proc is None:
+            return
+        self._remove_feh_pidfile()
+        if proc.poll() is not None:
+            return
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
 
-    @staticmethod
-    def _launch_feh(photo_path: str) -> None:
+    def _launch_feh(self, photos: List[str]) -> None:
+        """(Re)start a single feh slideshow that rotates through the photos directory."""
+        self._stop_feh()
         try:
-            subprocess.run(["killall", "feh"], check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except Exception:  # pragma: no cover - defensive best-effort cleanup
-            logger.debug("Failed to terminate existing feh instances", exc_info=True)
-
-        cmd = [
-            'feh',
-            '--on-last-slide', 'quit',
-            '--fullscreen',
-            '--zoom', 'fill',
-            photo_path,
-        ]
+            self._feh_proc = subprocess.Popen(
+                self._feh_cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=True,
+                start_new_session=True,
+            )
+        except OSError as exc:
+            logger.warning("Failed to launch feh for %s: %s", self._photos_dir, exc)
+            return
+        self._feh_photos = photos
         try:
-            subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with open(self._feh_pid_path, "w", encoding="utf-8") as pid_file:
+                pid_file.write(str(self._feh_proc.pid))
         except OSError as exc:
-            logger.warning("Failed to launch feh for %s: %s", photo_path, exc)
+            logger.warning("Failed to record feh pid: %s", exc)
+
+    def _advance_feh(self) -> None:
+        # SIGUSR1 makes a feh slideshow switch to the next image.
+        try:
+            os.kill(self._feh_proc.pid, signal.SIGUSR1)
+        except (AttributeError, OSError) as exc:
+            logger.debug("Failed to advance feh slideshow: %s", exc)
 
     def _slideshow_loop(self) -> None:
         logger.info("Starting slideshow loop for Google Photos selections")
+        # A single monotonic deadline drives the loop; setting the trigger (which
+        # shutdown also does) wakes it early, so there is no blocking sleep.
+        next_check = time.monotonic()
         try:
             while not self._slideshow_stop.is_set():
-                triggered = self._slideshow_trigger.wait(timeout=120)
+                remaining = max(0.0, next_check - time.monotonic())
+                triggered = self._slideshow_trigger.wait(timeout=remaining)
                 self._slideshow_trigger.clear()
 
                 if self._slideshow_stop.is_set():
                     break
 
-                photo_path = self._choose_random_photo()
-                if not photo_path:
-                    if not triggered:
-                        # No photos yet; try again on the next interval.
-                        continue
-                    # If triggered but nothing found, wait a short period before checking again
-                    time.sleep(5)
+                photos = self._list_downloaded_files()
+                if not photos:
+                    # No photos yet; re-check shortly after a trigger, otherwise on the next interval.
+                    delay = self.SLIDESHOW_RETRY_SECONDS if triggered else self.SLIDESHOW_INTERVAL_SECONDS
+                    next_check = time.monotonic() + delay
                     continue
 
-                self._launch_feh(photo_path)
+                # feh rotates images on its own; only (re)start it when it has exited
+                # or when new photos arrived, since it reads the directory at startup.
+                if not self._feh_running() or photos != self._feh_photos:
+                    self._launch_feh(photos)
+                elif triggered:
+                    self._advance_feh()
+                next_check = time.monotonic() + self.SLIDESHOW_INTERVAL_SECONDS
         finally:
+            self._stop_feh()
             logger.info("Slideshow loop terminated")
 
     def _start_slideshow(self) -> None:
         with self._slideshow_lock:
+            if self._stopped:
+                return
             if self._slideshow_thread and self._slideshow_thread.is_alive():
                 self._slideshow_trigger.set()
                 return
 
-            self._slideshow_stop.clear()
             self._slideshow_trigger.set()
             thread = threading.Thread(
                 target=self._slideshow_loop,
@@ -498,54 +865,103 @@ class PhotosPickerService:
             self._threads[session_id] = thread
         thread.start()
 
+    @staticmethod
+    def _is_retryable_error(exc: PhotosPickerServiceError) -> bool:
+        if isinstance(exc, CredentialConfigurationError):
+            return False
+        if isinstance(exc, PhotosPickerApiError) and exc.status_code is not None:
+            return exc.status_code == 429 or exc.status_code >= 500
+        # Network failures and unparsable responses are treated as transient.
+        return True
+
+    def _poll_backoff_delay(self, poll_interval: float, retry_count: int) -> float:
+        delay = poll_interval * (self.POLL_BACKOFF_BASE ** retry_count)
+        return min(self.POLL_BACKOFF_MAX_SECONDS, delay) + random.uniform(0, self.POLL_BACKOFF_JITTER_SECONDS)
+
     def _poll_session(self, session_id: str, poll_interval: float, deadline: datetime) -> None:
         end_time = time.monotonic() + max(0.0, (deadline - self._now()).total_seconds())
+        retry_count = 0
         try:
             while time.monotonic() <= end_time:
                 try:
                     session_data = self._request("GET", f"/sessions/{session_id}")
-                except PhotosPickerApiError as exc:
-                    error_payload = {"message": str(exc), "status": exc.status, "statusCode": exc.status_code}
-                    self._set_state(session_id, state="ERROR", error=error_payload)
-                    return
-                except PhotosPickerServiceError as exc:
-                    error_payload = {"message": str(exc)}
-                    self._set_state(session_id, state="ERROR", error=error_payload)
-                    return
+                    polled_at = self._now()
 
-                now = self._now()
-                self._set_state(session_id, session=session_data, last_polled_at=now)
-
-                if session_data.get("mediaItemsSet"):
-                    try:
+                    media_items = None
+                    if session_data.get("mediaItemsSet"):
                         media_items = self._safe_fetch_media_items(session_id)
-                    except PhotosPickerServiceError as exc:
+                except PhotosPickerServiceError as exc:
+                    retry_count += 1
+                    if not self._is_retryable_error(exc) or retry_count > self.MAX_POLL_RETRIES:
                         error_payload = {"message": str(exc)}
+                        if isinstance(exc, PhotosPickerApiError):
+                            error_payload.update({"status": exc.status, "statusCode": exc.status_code})
                         self._set_state(session_id, state="ERROR", error=error_payload)
                         return
-
+                    logger.warning("Polling session %s failed (attempt %d): %s", session_id, retry_count, exc)
+                    interval = self._poll_backoff_delay(poll_interval, retry_count)
+                else:
+                    retry_count = 0
+                    interval = poll_interval
+                    # Record the poll and any completion in a single state update.
                     if media_items is not None:
-                        self._set_state(session_id, state="COMPLETE", media_items=media_items,
-                                        completed_at=self._now())
+                        self._set_state(session_id, session=session_data, last_polled_at=polled_at,
+                                        state="COMPLETE", media_items=media_items, completed_at=self._now())
                         self._handle_session_completion(session_id, media_items)
                         return
+                    self._set_state(session_id, session=session_data, last_polled_at=polled_at)
 
-                sleep_until = min(end_time - time.monotonic(), poll_interval)
+                sleep_until = min(end_time - time.monotonic(), interval)
                 if sleep_until <= 0:
                     break
-                time.sleep(sleep_until)
+                if self._slideshow_stop.wait(sleep_until):
+                    return
 
             self._set_state(session_id, state="TIMEOUT")
+        except Exception as exc:
+            # Last resort: never leave a session stuck in PENDING because the poll thread died.
+            logger.exception("Polling session %s failed unexpectedly", session_id)
+            state = self._states.get(session_id)
+            if state is not None and state.state not in self.TERMINAL_STATES:
+                self._set_state(session_id, state="ERROR", error={"message": str(exc)})
         finally:
             with self._state_lock:
                 self._threads.pop(session_id, None)
 
     def get_status(self, session_id: str) -> Optional[Dict[str, Any]]:
-        with self._state_lock:
-            state = self._states.get(session_id)
-            if not state:
-                return None
-            return self._serialize_state(session_id, state)
+        """Return a snapshot of the session state.
+
+        Nested API payloads are shared with the internal cache and must be
+        treated as read-only.
+        """
+        # _states is replaced rather than mutated and its entries are frozen, so
+        # readers can take the current mapping without acquiring _state_lock.
+        state = self._states.get(session_id)
+        if not state:
+            return None
+        return self._serialize_state(session_id, state)
+
+    def show_next_photo(self) -> None:
+        """Advance the slideshow immediately, starting it if it is not running."""
+        if self._stopped:
+            logger.debug("Ignoring next-photo request after stop()")
+            return
+        self._start_slideshow()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the slideshow (terminating feh) and any session polling threads.
+
+        Stopping is permanent: later completions or next-photo requests do not
+        restart the slideshow.
+        """
+        with self._slideshow_lock:
+            self._stopped = True
+            self._slideshow_stop.set()
+            # Wake the slideshow loop so it notices the stop request right away.
+            self._slideshow_trigger.set()
+            thread = self._slideshow_thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
 
     def delete_session(self, session_id: str) -> None:
         """Delete a picking session and stop polling."""
@@ -558,7 +974,7 @@ class PhotosPickerService:
                 raise
         finally:
             with self._state_lock:
-                self._states.pop(session_id, None)
+                self._states = {key: value for key, value in self._states.items() if key != session_id}
                 thread = self._threads.pop(session_id, None)
             if thread and thread.is_alive():
                 # Threads will exit naturally when the state entry is removed.
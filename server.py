@@ -1,8 +1,29 @@
-import uuid
-from collections import deque
+import atexit
+import functools
+import logging
+import math
+import os
+import queue
+import re
+import signal
 import subprocess
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import Flask, jsonify, request, send_from_directory, url_for
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+try:
+    from flask_compress import Compress
+except ImportError:  # pragma: no cover - optional bandwidth saving
+    Compress = None
 
 from screensaver import (
     CredentialConfigurationError,
@@ -11,25 +32,136 @@ from screensaver import (
     PhotosPickerServiceError,
 )
 
+logger = logging.getLogger(__name__)
+
+
+class _NonFiniteFloat(float):
+    """Marks NaN/Infinity values decoded by the stdlib fallback.
+
+    orjson would encode them as null; as an unknown float subclass they instead make
+    orjson raise TypeError, which sends the payload back through the stdlib encoder.
+    """
+
+
+def _parse_float(value):
+    number = float(value)
+    return number if math.isfinite(number) else _NonFiniteFloat(number)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes and decodes with orjson when it is installed.
+
+    Anything orjson cannot handle exactly falls back to the stdlib-based default provider.
+    """
+
+    # orjson silently turns integers beyond 64 bits into floats; every 64-bit integer has
+    # at most 20 digits and those with 19-20 may overflow, so such input goes to the stdlib.
+    _LONG_DIGITS_STR = re.compile(r'\d{19}')
+    _LONG_DIGITS_BYTES = re.compile(rb'\d{19}')
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        indent = kwargs.get('indent')
+        if indent in (None, 2):
+            option = orjson.OPT_SORT_KEYS if kwargs['sort_keys'] else 0
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+            except TypeError:
+                # e.g. integers beyond 64 bits, non-string keys or relayed NaN/Infinity.
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        pattern = self._LONG_DIGITS_BYTES if isinstance(s, (bytes, bytearray)) else self._LONG_DIGITS_STR
+        if not kwargs and not pattern.search(s):
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                # Let the stdlib decide, keeping its error messages and NaN/Infinity support.
+                pass
+        kwargs.setdefault('parse_float', _parse_float)
+        kwargs.setdefault('parse_constant', _parse_float)
+        return super().loads(s, **kwargs)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+if Compress is not None:
+    # Only compress responses large enough to benefit, at the cheapest level, since the
+    # Pi's CPU rather than the LAN is the bottleneck for small pub/sub acknowledgements.
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_LEVEL', 1)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 1)
+    app.config.setdefault('COMPRESS_ZSTD_LEVEL', 1)
+    Compress(app)
 picker_service = PhotosPickerService()
+atexit.register(picker_service.stop)
+
+# Initialize a thread-safe in-memory FIFO queue; subscribers block on it while waiting for messages.
+# The queue is bounded so a runaway publisher cannot exhaust the Pi's memory.
+MESSAGES_QUEUE_MAXSIZE = 10_000
+PUBLISH_RETRY_AFTER_SECONDS = 5
+messages_queue = queue.Queue(maxsize=MESSAGES_QUEUE_MAXSIZE)
+
+# Prebuilt xset argv for each supported /display command.
+DPMS_CMDS = {
+    'on': ('xset', '-display', ':0', 'dpms', 'force', 'on'),
+    'off': ('xset', '-display', ':0', 'dpms', 'force', 'off'),
+}
+
+# Display commands run off the request thread; a single worker keeps on/off requests in order.
+_shell_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='display-shell')
+
+# Upper bound (in seconds) for how long /subscribe holds a request open waiting for a message.
+SUBSCRIBE_MAX_WAIT_SECONDS = 25.0
 
-# Initialize an in-memory queue using deque from collections for efficient FIFO operations.
-messages_queue = deque()
+# Size of the waitress worker pool. Each waiting /subscribe occupies a worker, so only
+# SUBSCRIBE_MAX_WAITERS of them may long-poll at once (half the pool by default); further
+# subscribers are answered immediately, leaving workers free for /publish and the rest.
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '16'))
+SUBSCRIBE_MAX_WAITERS = int(os.environ.get('SUBSCRIBE_MAX_WAITERS', max(1, SERVER_THREADS // 2)))
+_subscribe_waiters = threading.BoundedSemaphore(SUBSCRIBE_MAX_WAITERS)
+
+
+def _log_display_result(future):
+    # The endpoint has already answered 202, so surface failures in the log instead.
+    exc = future.exception()
+    if exc is not None:
+        logger.warning("Display command failed: %s", exc)
+        return
+    result = future.result()
+    if result.returncode != 0:
+        logger.warning("Display command %s exited with status %d", ' '.join(result.args), result.returncode)
 
 
 @app.route('/display', methods=['GET'])
 def control_display():
     cmd = request.args.get('cmd')
 
-    if cmd == 'on':
-        subprocess.run(['DISPLAY=:0 xset dpms force on'], shell=True)
-    elif cmd == 'off':
-        subprocess.run(['DISPLAY=:0 xset dpms force off'], shell=True)
-    else:
+    cmd_args = DPMS_CMDS.get(cmd)
+    if cmd_args is None:
         return "Invalid command", 400
 
-    return f"Display turned {cmd}", 200
+    # Invoke xset directly rather than through a shell, without blocking the request.
+    future = _shell_pool.submit(subprocess.run, cmd_args, check=False)
+    future.add_done_callback(_log_display_result)
+
+    return f"Display turning {cmd}", 202
+
+
+# Clients typically resend the same requestId/maxItemCount values, so memoize the parsing.
+# Unhashable JSON values (lists, objects) raise TypeError and are rejected as invalid.
+@functools.lru_cache(maxsize=1024)
+def _normalize_request_id(value):
+    return str(uuid.UUID(str(value)))
+
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _parse_max_items(value):
+    return int(value)
 
 
 @app.route('/selectPhotos', methods=['POST'])
@@ -39,14 +171,14 @@ def create_selection_session():
     request_id_value = payload.get('requestId')
     if request_id_value:
         try:
-            request_id_value = str(uuid.UUID(str(request_id_value)))
-        except (ValueError, AttributeError):
+            request_id_value = _normalize_request_id(request_id_value)
+        except (TypeError, ValueError, AttributeError):
             return jsonify({'error': 'requestId must be a valid UUID string.'}), 400
 
     picking_config = None
     if 'maxItemCount' in payload and payload['maxItemCount'] is not None:
         try:
-            max_items = int(payload['maxItemCount'])
+            max_items = _parse_max_items(payload['maxItemCount'])
         except (TypeError, ValueError):
             return jsonify({'error': 'maxItemCount must be an integer.'}), 400
         if max_items < 0:
@@ -105,26 +237,61 @@ def get_selection_session():
     if not status_payload:
         return jsonify({'error': 'Session not found.'}), 404
 
-    return jsonify(status_payload), 200
+    # Status only changes when updatedAt does, so clients polling with If-None-Match get an
+    # empty 304 instead of the full payload (including mediaItems) on every repeat poll.
+    # The validator is weak because the body varies by content encoding; flask-compress
+    # would otherwise rewrite a strong ETag per encoding and it would never match here.
+    etag = f"{session_id}-{status_payload['updatedAt']}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    response = jsonify(status_payload)
+    response.set_etag(etag, weak=True)
+    return response, 200
+
+
+@app.route('/screensaver/next', methods=['POST'])
+def show_next_photo():
+    picker_service.show_next_photo()
+    return jsonify({'status': 'Advancing to next photo'}), 200
 
 
 @app.route('/publish', methods=['POST'])
 def publish():
     # Extract the JSON object from the request and add it to the queue.
     message = request.json
-    messages_queue.append(message)
+    try:
+        messages_queue.put_nowait(message)
+    except queue.Full:
+        response = jsonify({'error': 'Message queue is full'})
+        response.headers['Retry-After'] = str(PUBLISH_RETRY_AFTER_SECONDS)
+        return response, 503
     return jsonify({'status': 'Message added to queue'}), 200
 
 
 @app.route('/subscribe', methods=['GET'])
 def subscribe():
-    if messages_queue:
-        # Pop the leftmost (oldest) message from the queue to process it.
-        message = messages_queue.popleft()
-        return jsonify(message), 200
-    else:
-        # If the queue is empty, inform the subscriber.
+    # Long-poll: wait up to `timeout` seconds for a message instead of answering empty immediately.
+    try:
+        timeout = float(request.args.get('timeout', SUBSCRIBE_MAX_WAIT_SECONDS))
+    except ValueError:
+        return jsonify({'error': 'timeout must be a number.'}), 400
+    timeout = min(max(timeout, 0.0), SUBSCRIBE_MAX_WAIT_SECONDS)
+
+    # Beyond the long-poll cap, fall back to an immediate answer instead of tying up a worker.
+    waiting = timeout > 0 and _subscribe_waiters.acquire(blocking=False)
+    try:
+        # Take the oldest message from the queue to process it.
+        message = messages_queue.get(timeout=timeout) if waiting else messages_queue.get_nowait()
+    except queue.Empty:
+        # If the queue stayed empty, inform the subscriber.
         return jsonify({'status': 'No messages in queue'}), 200
+    finally:
+        if waiting:
+            _subscribe_waiters.release()
+    return jsonify(message), 200
 
 
 @app.route('/')
@@ -132,5 +299,18 @@ def serve_index():
     return send_from_directory('static', 'index.html')
 
 
+def _handle_sigterm(signum, frame):
+    # Exit normally so the atexit hook stops the slideshow and its feh process.
+    sys.exit(0)
+
+
 if __name__ == "__main__":
-    app.run(debug=False, port=8080, host='0.0.0.0')
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    if os.environ.get('FLASK_DEV'):
+        app.run(debug=False, port=8080, host='0.0.0.0')
+    else:
+        # Serve through waitress' thread pool so keep-alive connections and
+        # concurrent requests are handled without the Werkzeug dev server.
+        from waitress import serve
+
+        serve(app, host='0.0.0.0', port=8080, threads=SERVER_THREADS, channel_timeout=120)